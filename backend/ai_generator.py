@@ -1,11 +1,47 @@
+import asyncio
+import functools
+import hashlib
+import json
+from collections import OrderedDict
 import anthropic
-from typing import List, Optional, Dict, Any
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
+
+# The SDK retries 408/409/429/5xx and timeouts itself, with jittered exponential
+# backoff that honours retry-after; each retry resends the identical payload,
+# so prompt-cache breakpoints still hit
+API_MAX_RETRIES = 4
+API_TIMEOUT = 30.0
+
+
+def _tail_tokens(text: str, max_tokens: int) -> str:
+    """
+    Keep roughly the last max_tokens tokens of text (~4 chars per token),
+    dropping the partial leading line when the cut falls mid-message.
+    """
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    # A cut right after a newline already starts on a whole line
+    if text[-max_chars - 1] == "\n":
+        return tail
+    newline = tail.find("\n")
+    return tail[newline + 1 :] if newline != -1 else tail
+
+
+@functools.lru_cache(maxsize=8)
+def _get_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Return a shared client per API key so its connection pool is reused"""
+    return anthropic.AsyncAnthropic(
+        api_key=api_key, max_retries=API_MAX_RETRIES, timeout=API_TIMEOUT
+    )
 
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
 
     MAX_TOOL_ROUNDS = 2
+    RESPONSE_CACHE_SIZE = 256
 
     # Static system prompt to avoid rebuilding on each call
     SYSTEM_PROMPT = """ You are an AI assistant specialized in course materials and educational content with access to a comprehensive search tool for course information.
@@ -33,103 +69,264 @@ Provide only the direct answer to what was asked.
 """
 
     def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = _get_client(api_key)
         self.model = model
 
         # Pre-build base API parameters
         self.base_params = {"model": self.model, "temperature": 0, "max_tokens": 800}
 
-    def generate_response(
+        # Approximate token budget for conversation history in the system prompt
+        self.max_history_tokens = 1024
+
+        # Pre-build the system blocks used when there is no history; the static
+        # prompt carries a cache breakpoint so its prefix stays byte-identical
+        self._system_no_history = [
+            {
+                "type": "text",
+                "text": self.SYSTEM_PROMPT,
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+
+        # LRU of answers to identical requests that needed no tool execution
+        self._response_cache: OrderedDict[str, str] = OrderedDict()
+        self.cache_hits = 0
+
+        # First-round calls in flight, shared by identical concurrent requests
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def generate_response(
         self,
         query: str,
         conversation_history: Optional[str] = None,
         tools: Optional[List] = None,
         tool_manager=None,
+        sources: Optional[List] = None,
     ) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
-        Supports up to MAX_TOOL_ROUNDS of tool calls before forcing a text response.
+        Supports up to MAX_TOOL_ROUNDS of tool calls; after that, only the text of
+        the final call is returned.
+        Sources surfaced by tool calls are appended to sources, if given.
         """
+        answer, final_params = await self._run_tool_rounds(
+            query, conversation_history, tools, tool_manager, sources
+        )
+        if answer is not None:
+            return answer
 
-        # Build system content efficiently - avoid string ops when possible
+        final_response = await self.client.messages.create(**final_params)
+        return self._extract_text(final_response)
+
+    async def generate_response_stream(
+        self,
+        query: str,
+        conversation_history: Optional[str] = None,
+        tools: Optional[List] = None,
+        tool_manager=None,
+        sources: Optional[List] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming variant of generate_response. Tool rounds are still
+        accumulated, but the final no-tools call yields text as it arrives.
+        """
+        answer, final_params = await self._run_tool_rounds(
+            query, conversation_history, tools, tool_manager, sources
+        )
+        if answer is not None:
+            yield answer
+            return
+
+        async with self.client.messages.stream(**final_params) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+    async def _run_tool_rounds(
+        self, query, conversation_history, tools, tool_manager, sources=None
+    ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Run up to MAX_TOOL_ROUNDS of tool calls.
+
+        Returns:
+            (answer, final_params) tuple — answer is set when Claude finished
+            within the rounds, otherwise final_params holds the final call
+        """
+
+        # History follows the cached static prompt in its own, uncached block,
+        # trimmed so long sessions do not grow every call's prompt
+        if conversation_history:
+            conversation_history = _tail_tokens(
+                conversation_history, self.max_history_tokens
+            )
         system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
+            [
+                self._system_no_history[0],
+                {
+                    "type": "text",
+                    "text": f"Previous conversation:\n{conversation_history}",
+                },
+            ]
             if conversation_history
-            else self.SYSTEM_PROMPT
+            else self._system_no_history
         )
 
+        # Breakpoint on the last tool definition caches the whole tool schema;
+        # copy it so the caller's definitions are left untouched
+        if tools:
+            tools = [*tools[:-1], {**tools[-1], "cache_control": {"type": "ephemeral"}}]
+
         messages = [{"role": "user", "content": query}]
 
-        for round_num in range(self.MAX_TOOL_ROUNDS):
-            api_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": system_content,
-            }
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
+        cache_key = self._cache_key(system_content, messages, tools)
+        cached = self._response_cache.get(cache_key)
+        if cached is not None:
+            self._response_cache.move_to_end(cache_key)
+            self.cache_hits += 1
+            return cached, None
 
-            response = self.client.messages.create(**api_params)
+        # Built once: messages grows in place, so only the final call differs
+        api_params = {
+            **self.base_params,
+            "messages": messages,
+            "system": system_content,
+        }
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = {"type": "auto"}
 
-            if response.stop_reason != "tool_use" or not tool_manager:
-                return self._extract_text(response)
+        # Round 1 runs before any tool, so identical requests can share the
+        # in-flight call and its answer can be cached; each caller still runs
+        # any tools it asks for into its own transcript and sources
+        response = await self._create_shared(cache_key, api_params)
+        if response.stop_reason != "tool_use" or not tool_manager:
+            answer = self._extract_text(response)
+            # Truncated or unanswered tool_use replies are never replayed
+            if response.stop_reason == "end_turn":
+                self._cache_response(cache_key, answer)
+            return answer, None
 
-            # Execute tools, accumulate messages
-            messages, tool_failed = self._execute_tool_round(
-                messages, response, tool_manager
-            )
+        # Execute tools, appending this round to messages in place
+        tool_failed = await self._append_tool_round(
+            messages,
+            response,
+            tool_manager,
+            sources,
+            cache_results=self.MAX_TOOL_ROUNDS > 1,
+        )
+
+        # Later rounds depend on tool results: neither shared nor cached
+        for round_number in range(2, self.MAX_TOOL_ROUNDS + 1):
             if tool_failed:
                 break
 
-        # Exhausted rounds or tool failed — final call WITHOUT tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": system_content,
-        }
-        final_response = self.client.messages.create(**final_params)
-        return self._extract_text(final_response)
+            response = await self.client.messages.create(**api_params)
+            if response.stop_reason != "tool_use":
+                return self._extract_text(response), None
 
-    def _execute_tool_round(self, messages, response, tool_manager):
+            tool_failed = await self._append_tool_round(
+                messages,
+                response,
+                tool_manager,
+                sources,
+                cache_results=round_number < self.MAX_TOOL_ROUNDS,
+            )
+
+        # Exhausted rounds or tool failed — the final call keeps the same tools,
+        # since changing them would invalidate the cached prefix; any tool_use
+        # it asks for is not run, and only its text is returned
+        return None, api_params
+
+    async def _create_shared(self, cache_key: str, api_params: Dict[str, Any]):
+        """Issue messages.create, joining an identical call already in flight."""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self.client.messages.create(**api_params))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        # Shield so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _cache_key(system_content, messages, tools) -> str:
+        """Hash the request payload into a response-cache key."""
+        payload = json.dumps(
+            [system_content, messages, tools], sort_keys=True, default=str
+        )
+        return hashlib.blake2b(payload.encode()).hexdigest()
+
+    def _cache_response(self, cache_key: str, answer: str):
+        """Store an answer, evicting the least recently used entry when full."""
+        self._response_cache[cache_key] = answer
+        if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+
+    async def _append_tool_round(
+        self, messages, response, tool_manager, sources=None, cache_results=False
+    ):
         """
-        Execute tool calls from a response, append results to messages.
+        Execute tool calls from a response concurrently and append the assistant
+        turn plus tool results to messages in place. Each call's sources are
+        added to sources in tool_use order, whatever order the calls finish in.
+        With cache_results, the newest tool_result gets a cache breakpoint.
 
         Returns:
-            (updated_messages, tool_failed) tuple
+            True if any tool raised, else False
         """
-        messages = messages.copy()
         messages.append({"role": "assistant", "content": response.content})
 
+        tool_blocks = [block for block in response.content if block.type == "tool_use"]
+
+        # Tools are blocking, so each call runs in a worker thread; the round
+        # then takes as long as its slowest tool rather than their sum
+        outcomes = await asyncio.gather(
+            *(
+                asyncio.to_thread(
+                    tool_manager.execute_tool_with_sources, block.name, **block.input
+                )
+                for block in tool_blocks
+            ),
+            return_exceptions=True,
+        )
+
         tool_results = []
         tool_failed = False
 
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                try:
-                    tool_result = tool_manager.execute_tool(
-                        content_block.name, **content_block.input
-                    )
-                except Exception as e:
-                    tool_result = f"Error executing tool: {e}"
-                    tool_failed = True
-
-                tool_results.append(
-                    {
-                        "type": "tool_result",
-                        "tool_use_id": content_block.id,
-                        "content": tool_result,
-                    }
-                )
+        for content_block, outcome in zip(tool_blocks, outcomes):
+            if isinstance(outcome, Exception):
+                tool_result = f"Error executing tool: {outcome}"
+                tool_failed = True
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                tool_result, found = outcome
+                if sources is not None:
+                    sources.extend(found)
+
+            tool_results.append(
+                {
+                    "type": "tool_result",
+                    "tool_use_id": content_block.id,
+                    "content": tool_result,
+                }
+            )
 
         if tool_results:
+            # The next call writes this breakpoint; it only pays off when
+            # another call can follow and read it, so the caller skips it for
+            # the last round, and a failed tool goes straight to the final call
+            if cache_results and not tool_failed:
+                tool_results[-1]["cache_control"] = {"type": "ephemeral"}
             messages.append({"role": "user", "content": tool_results})
 
-        return messages, tool_failed
+        return tool_failed
 
     def _extract_text(self, response):
         """Extract the first text block from a response."""
-        for block in response.content:
+        blocks = response.content
+        # Terminal responses almost always lead with their text block
+        if blocks and blocks[0].type == "text":
+            return blocks[0].text
+        for block in blocks[1:]:
             if block.type == "text":
                 return block.text
         return ""
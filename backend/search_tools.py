@@ -1,4 +1,4 @@
-from typing import Dict, Any, Optional, Protocol
+from typing import Dict, Any, List, Optional, Protocol, Tuple
 from abc import ABC, abstractmethod
 from vector_store import VectorStore, SearchResults
 
@@ -16,6 +16,10 @@ class Tool(ABC):
         """Execute the tool with given parameters"""
         pass
 
+    def execute_with_sources(self, **kwargs) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute the tool, returning its result and the sources it surfaced"""
+        return self.execute(**kwargs), []
+
 
 class CourseSearchTool(Tool):
     """Tool for searching course content with semantic course name matching"""
@@ -66,6 +70,29 @@ class CourseSearchTool(Tool):
         Returns:
             Formatted search results or error message
         """
+        return self._search(query, course_name, lesson_number, self.last_sources)
+
+    def execute_with_sources(
+        self,
+        query: str,
+        course_name: Optional[str] = None,
+        lesson_number: Optional[int] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Execute the search, returning its sources instead of adding them to
+        last_sources, so concurrent queries never see each other's sources.
+        """
+        sources = []
+        return self._search(query, course_name, lesson_number, sources), sources
+
+    def _search(
+        self,
+        query: str,
+        course_name: Optional[str],
+        lesson_number: Optional[int],
+        sources: List[Dict[str, Any]],
+    ) -> str:
+        """Run the search, recording the sources of any results in sources"""
 
         # Use the vector store's unified search interface
         results = self.store.search(
@@ -86,12 +113,14 @@ class CourseSearchTool(Tool):
             return f"No relevant content found{filter_info}."
 
         # Format and return results
-        return self._format_results(results)
+        return self._format_results(results, sources)
 
-    def _format_results(self, results: SearchResults) -> str:
+    def _format_results(
+        self, results: SearchResults, sources: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
         """Format search results with course and lesson context"""
         formatted = []
-        sources = []  # Track sources for the UI
+        found = []  # Track sources for the UI
 
         for doc, meta in zip(results.documents, results.metadata):
             course_title = meta.get("course_title", "unknown")
@@ -112,12 +141,12 @@ class CourseSearchTool(Tool):
             if lesson_num is not None:
                 url = self.store.get_lesson_link(course_title, lesson_num)
 
-            sources.append({"name": name, "url": url})
+            found.append({"name": name, "url": url})
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources.extend(sources)
+        # Store sources for retrieval, in last_sources unless told otherwise
+        (self.last_sources if sources is None else sources).extend(found)
 
         return "\n\n".join(formatted)
 
@@ -147,16 +176,11 @@ class ToolManager:
 
         return self.tools[tool_name].execute(**kwargs)
 
-    def get_last_sources(self) -> list:
-        """Get sources from the last search operation"""
-        # Check all tools for last_sources attribute
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources") and tool.last_sources:
-                return tool.last_sources
-        return []
-
-    def reset_sources(self):
-        """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, "last_sources"):
-                tool.last_sources = []
+    def execute_tool_with_sources(
+        self, tool_name: str, **kwargs
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Execute a tool by name, returning its result and the sources it found"""
+        if tool_name not in self.tools:
+            return f"Tool '{tool_name}' not found", []
+
+        return self.tools[tool_name].execute_with_sources(**kwargs)
@@ -1,16 +1,19 @@
 import sys
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
+import httpx
 import pytest
+import pytest_asyncio
 
 # Add backend/ to sys.path so bare imports (e.g. `from vector_store import ...`) resolve
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from fastapi import FastAPI, HTTPException
-from fastapi.testclient import TestClient
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 
 
 # ---------------------------------------------------------------------------
@@ -33,20 +36,56 @@ def mock_config():
     return cfg
 
 
+def _stream_events(*events):
+    """Build a side_effect that returns a fresh async generator of events."""
+
+    async def gen(*args, **kwargs):
+        for event in events:
+            yield dict(event)
+
+    return gen
+
+
 @pytest.fixture
-def mock_rag_system():
-    """A MagicMock mimicking RAGSystem with sensible defaults."""
-    rag = MagicMock()
-    rag.query.return_value = ("Test answer", [{"source": "test.txt"}])
+def stream_events():
+    """Factory for query_stream side effects, e.g. stream_events(event, ...)."""
+    return _stream_events
+
+
+def _apply_rag_defaults(rag):
+    """Set the default return values on a RAGSystem mock."""
+    rag.query = AsyncMock(return_value=("Test answer", [{"source": "test.txt"}]))
+    rag.query_stream = MagicMock(
+        side_effect=_stream_events(
+            {"type": "text", "text": "Test answer"},
+            {"type": "done", "sources": [{"source": "test.txt"}]},
+        )
+    )
     rag.get_course_analytics.return_value = {
         "total_courses": 2,
         "course_titles": ["Course A", "Course B"],
     }
     rag.session_manager.create_session.return_value = "new-session-123"
     rag.session_manager.delete_session.return_value = None
+
+
+@pytest.fixture(scope="session")
+def mock_rag_system():
+    """A MagicMock mimicking RAGSystem with sensible defaults, shared by the
+    session-wide test app and reset before every API test."""
+    rag = MagicMock()
+    _apply_rag_defaults(rag)
     return rag
 
 
+@pytest.fixture
+def reset_mock_rag_system(mock_rag_system):
+    """Clear calls and per-test overrides left on the shared RAGSystem mock;
+    test modules using the test app opt in via usefixtures."""
+    mock_rag_system.reset_mock(return_value=True, side_effect=True)
+    _apply_rag_defaults(mock_rag_system)
+
+
 def _build_test_app(mock_rag):
     """Create a lightweight FastAPI app with the same endpoints as app.py,
     but using mock_rag instead of importing the real RAGSystem."""
@@ -72,11 +111,28 @@ def _build_test_app(mock_rag):
             session_id = request.session_id
             if not session_id:
                 session_id = mock_rag.session_manager.create_session()
-            answer, sources = mock_rag.query(request.query, session_id)
+            answer, sources = await mock_rag.query(request.query, session_id)
             return QueryResponse(answer=answer, sources=sources, session_id=session_id)
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    @app.post("/api/query/stream")
+    async def query_documents_stream(request: QueryRequest):
+        session_id = request.session_id
+        if not session_id:
+            session_id = mock_rag.session_manager.create_session()
+
+        async def events():
+            try:
+                async for event in mock_rag.query_stream(request.query, session_id):
+                    if event["type"] == "done":
+                        event["session_id"] = session_id
+                    yield json.dumps(event) + "\n"
+            except Exception as e:
+                yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
     @app.get("/api/courses", response_model=CourseStats)
     async def get_course_stats():
         try:
@@ -96,15 +152,17 @@ def _build_test_app(mock_rag):
     return app
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_app(mock_rag_system):
     """A FastAPI test app wired to mock_rag_system, returned as (app, mock_rag)."""
     app = _build_test_app(mock_rag_system)
     return app, mock_rag_system
 
 
-@pytest.fixture
-def client(test_app):
-    """A TestClient wrapping the test app."""
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client(test_app):
+    """An httpx AsyncClient calling the test app in-process, without threads."""
     app, _ = test_app
-    return TestClient(app)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        yield c
@@ -1,33 +1,85 @@
-from unittest.mock import MagicMock, patch
+import asyncio
+import copy
+import json
+import threading
+from dataclasses import dataclass
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 import pytest
-from ai_generator import AIGenerator
+from ai_generator import AIGenerator, _get_client, _tail_tokens
+
+
+@pytest.fixture(autouse=True)
+def _clear_client_cache():
+    """Drop memoized clients so each test sees its own patched AsyncAnthropic."""
+    _get_client.cache_clear()
+    yield
+    _get_client.cache_clear()
+
 
 # ---------------------------------------------------------------------------
 # Mock response helpers
 # ---------------------------------------------------------------------------
 
 
+@dataclass(frozen=True, slots=True)
+class TextBlock:
+    text: str = ""
+    type: str = "text"
+
+
+@dataclass(frozen=True, slots=True)
+class ToolUseBlock:
+    name: str
+    id: str
+    input: dict
+    type: str = "tool_use"
+
+
 def _text_block(text):
-    block = MagicMock()
-    block.type = "text"
-    block.text = text
-    return block
+    return TextBlock(text=text)
 
 
 def _tool_use_block(name="search_course_content", tool_id="tool_123", input_data=None):
-    block = MagicMock()
-    block.type = "tool_use"
-    block.name = name
-    block.id = tool_id
-    block.input = input_data or {"query": "test"}
-    return block
+    return ToolUseBlock(name=name, id=tool_id, input=input_data or {"query": "test"})
 
 
 def _mock_response(content_blocks, stop_reason="end_turn"):
-    resp = MagicMock()
-    resp.content = content_blocks
-    resp.stop_reason = stop_reason
-    return resp
+    return SimpleNamespace(content=content_blocks, stop_reason=stop_reason)
+
+
+def assert_messages_shape(messages, expected_roles, tool_use_id=None):
+    """Check message roles in order and, optionally, that a tool_result
+    answering tool_use_id is present."""
+    assert [m["role"] for m in messages] == expected_roles
+    if tool_use_id:
+        blob = json.dumps(messages, default=str)
+        assert f'"tool_use_id": "{tool_use_id}"' in blob
+
+
+class _FakeStream:
+    """Stand-in for the async context manager returned by messages.stream."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+def _mock_client(MockAnthropic):
+    """Return the patched client with an awaitable messages.create."""
+    client = MockAnthropic.return_value
+    client.messages.create = AsyncMock()
+    return client
 
 
 # ---------------------------------------------------------------------------
@@ -35,23 +87,24 @@ def _mock_response(content_blocks, stop_reason="end_turn"):
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio
 class TestAIGeneratorDirectAnswer:
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_direct_answer_no_tools(self, MockAnthropic):
-        client = MockAnthropic.return_value
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_direct_answer_no_tools(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
         client.messages.create.return_value = _mock_response(
             [_text_block("Hello!")], stop_reason="end_turn"
         )
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        result = gen.generate_response(query="Hi")
+        result = await gen.generate_response(query="Hi")
 
         assert result == "Hello!"
         client.messages.create.assert_called_once()
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_direct_answer_tools_available_but_unused(self, MockAnthropic):
-        client = MockAnthropic.return_value
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_direct_answer_tools_available_but_unused(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
         client.messages.create.return_value = _mock_response(
             [_text_block("General answer")], stop_reason="end_turn"
         )
@@ -60,24 +113,45 @@ class TestAIGeneratorDirectAnswer:
         tools = [
             {"name": "search_course_content", "description": "...", "input_schema": {}}
         ]
-        result = gen.generate_response(query="What is 2+2?", tools=tools)
+        result = await gen.generate_response(query="What is 2+2?", tools=tools)
 
         assert result == "General answer"
         call_kwargs = client.messages.create.call_args[1]
         assert "tools" in call_kwargs
         assert call_kwargs["tool_choice"] == {"type": "auto"}
 
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_last_tool_definition_cached(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("ok")], stop_reason="end_turn"
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        tools = [
+            {"name": "a", "description": "", "input_schema": {}},
+            {"name": "b", "description": "", "input_schema": {}},
+        ]
+        await gen.generate_response(query="q", tools=tools)
+
+        sent_tools = client.messages.create.call_args[1]["tools"]
+        assert "cache_control" not in sent_tools[0]
+        assert sent_tools[1]["cache_control"] == {"type": "ephemeral"}
+        # Caller's definitions are not mutated
+        assert "cache_control" not in tools[1]
+
 
 # ---------------------------------------------------------------------------
 # Tests — Single Tool Round
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio
 class TestAIGeneratorSingleToolRound:
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_single_tool_round_flow(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_single_tool_round_flow(self, MockAnthropic):
         """One tool call → text response = 2 API calls."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
         second_resp = _mock_response(
@@ -87,26 +161,26 @@ class TestAIGeneratorSingleToolRound:
         client.messages.create.side_effect = [first_resp, second_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "search result text"
+        tool_manager.execute_tool_with_sources.return_value = ("search result text", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
         tools = [
             {"name": "search_course_content", "description": "...", "input_schema": {}}
         ]
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="What is ML?", tools=tools, tool_manager=tool_manager
         )
 
         assert result == "Based on the search, the answer is X."
         assert client.messages.create.call_count == 2
-        tool_manager.execute_tool.assert_called_once_with(
+        tool_manager.execute_tool_with_sources.assert_called_once_with(
             "search_course_content", query="test"
         )
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_second_call_message_structure(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_second_call_message_structure(self, MockAnthropic):
         """Verify the second API call includes assistant + tool_result messages."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         tool_block = _tool_use_block(tool_id="abc")
         first_resp = _mock_response([tool_block], stop_reason="tool_use")
@@ -114,10 +188,10 @@ class TestAIGeneratorSingleToolRound:
         client.messages.create.side_effect = [first_resp, second_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "result"
+        tool_manager.execute_tool_with_sources.return_value = ("result", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(
+        await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -126,28 +200,29 @@ class TestAIGeneratorSingleToolRound:
         second_call_kwargs = client.messages.create.call_args_list[1][1]
         messages = second_call_kwargs["messages"]
 
-        # messages[0] = user, messages[1] = assistant (tool_use), messages[2] = user (tool_result)
-        assert messages[1]["role"] == "assistant"
-        assert messages[2]["role"] == "user"
+        assert_messages_shape(
+            messages, ["user", "assistant", "user"], tool_use_id="abc"
+        )
         tool_result = messages[2]["content"][0]
         assert tool_result["type"] == "tool_result"
         assert tool_result["tool_use_id"] == "abc"
         assert tool_result["content"] == "result"
+        assert tool_result["cache_control"] == {"type": "ephemeral"}
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_second_call_has_tools(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_second_call_has_tools(self, MockAnthropic):
         """Round 2 call still includes tools since MAX_TOOL_ROUNDS > 1."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
         second_resp = _mock_response([_text_block("done")], stop_reason="end_turn")
         client.messages.create.side_effect = [first_resp, second_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "result"
+        tool_manager.execute_tool_with_sources.return_value = ("result", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(
+        await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -162,11 +237,12 @@ class TestAIGeneratorSingleToolRound:
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio
 class TestAIGeneratorTwoToolRounds:
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_two_tool_rounds_flow(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_two_tool_rounds_flow(self, MockAnthropic):
         """Two tool calls → final text = 3 API calls."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response(
             [_tool_use_block(tool_id="t1")], stop_reason="tool_use"
@@ -181,24 +257,24 @@ class TestAIGeneratorTwoToolRounds:
         client.messages.create.side_effect = [first_resp, second_resp, final_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "result"
+        tool_manager.execute_tool_with_sources.return_value = ("result", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
         tools = [
             {"name": "search_course_content", "description": "...", "input_schema": {}}
         ]
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="Compare courses", tools=tools, tool_manager=tool_manager
         )
 
         assert result == "Combined answer."
         assert client.messages.create.call_count == 3
-        assert tool_manager.execute_tool.call_count == 2
+        assert tool_manager.execute_tool_with_sources.call_count == 2
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_two_rounds_message_accumulation(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_two_rounds_message_accumulation(self, MockAnthropic):
         """Final call has 5 messages: user, asst, tool_result, asst, tool_result."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response(
             [_tool_use_block(tool_id="t1")], stop_reason="tool_use"
@@ -210,10 +286,10 @@ class TestAIGeneratorTwoToolRounds:
         client.messages.create.side_effect = [first_resp, second_resp, final_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "r"
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(
+        await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -222,17 +298,18 @@ class TestAIGeneratorTwoToolRounds:
         final_call_kwargs = client.messages.create.call_args_list[2][1]
         messages = final_call_kwargs["messages"]
 
-        assert len(messages) == 5
-        assert messages[0]["role"] == "user"  # original query
-        assert messages[1]["role"] == "assistant"  # tool_use 1
-        assert messages[2]["role"] == "user"  # tool_result 1
-        assert messages[3]["role"] == "assistant"  # tool_use 2
-        assert messages[4]["role"] == "user"  # tool_result 2
+        # query, tool_use 1, tool_result 1, tool_use 2, tool_result 2
+        assert_messages_shape(
+            messages,
+            ["user", "assistant", "user", "assistant", "user"],
+            tool_use_id="t2",
+        )
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_two_rounds_final_call_has_no_tools(self, MockAnthropic):
-        """After exhausting MAX_TOOL_ROUNDS, the final call excludes tools."""
-        client = MockAnthropic.return_value
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_two_rounds_final_call_keeps_tools(self, MockAnthropic):
+        """After exhausting MAX_TOOL_ROUNDS, the final call sends the same tools
+        so its prefix still matches the cached rounds."""
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response(
             [_tool_use_block(tool_id="t1")], stop_reason="tool_use"
@@ -244,22 +321,108 @@ class TestAIGeneratorTwoToolRounds:
         client.messages.create.side_effect = [first_resp, second_resp, final_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "r"
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(
+        await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
         )
 
-        final_call_kwargs = client.messages.create.call_args_list[2][1]
-        assert "tools" not in final_call_kwargs
+        first_call_kwargs, final_call_kwargs = (
+            client.messages.create.call_args_list[i][1] for i in (0, 2)
+        )
+        assert final_call_kwargs["tools"] == first_call_kwargs["tools"]
+        assert final_call_kwargs["tool_choice"] == first_call_kwargs["tool_choice"]
+        assert tool_manager.execute_tool_with_sources.call_count == 2
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_final_call_tool_use_is_not_run(self, MockAnthropic):
+        """A tool_use from the final call is not executed; its text is returned."""
+        client = _mock_client(MockAnthropic)
+
+        tool_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
+        final_resp = _mock_response(
+            [_text_block("best answer so far"), _tool_use_block()],
+            stop_reason="tool_use",
+        )
+        client.messages.create.side_effect = [tool_resp, tool_resp, final_resp]
+
+        tool_manager = MagicMock()
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        result = await gen.generate_response(
+            query="q",
+            tools=[{"name": "t", "description": "", "input_schema": {}}],
+            tool_manager=tool_manager,
+        )
+
+        assert result == "best answer so far"
+        assert client.messages.create.call_count == 3
+        assert tool_manager.execute_tool_with_sources.call_count == 2
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_tool_result_breakpoints_are_readable(self, MockAnthropic):
+        """Every tool_result breakpoint a call writes is read by a later call
+        sending the same tools, system and message prefix."""
+        client = _mock_client(MockAnthropic)
+        responses = iter(
+            [
+                _mock_response([_tool_use_block(tool_id="t1")], "tool_use"),
+                _mock_response([_tool_use_block(tool_id="t2")], "tool_use"),
+                _mock_response([_text_block("done")], "end_turn"),
+            ]
+        )
+        sent = []
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_max_rounds_enforced(self, MockAnthropic):
+        async def create(**kwargs):
+            # messages grows in place, so snapshot what each call actually sent
+            sent.append(copy.deepcopy(kwargs))
+            return next(responses)
+
+        client.messages.create.side_effect = create
+
+        tool_manager = MagicMock()
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        await gen.generate_response(
+            query="q",
+            tools=[{"name": "t", "description": "", "input_schema": {}}],
+            tool_manager=tool_manager,
+        )
+
+        def same_prefix(a, b, end):
+            return (
+                a["tools"] == b["tools"]
+                and a["system"] == b["system"]
+                and a["messages"][: end + 1] == b["messages"][: end + 1]
+            )
+
+        assert len(sent) == 3
+        written = []
+        for i, call in enumerate(sent):
+            for end, message in enumerate(call["messages"]):
+                content = message["content"]
+                last = content[-1] if isinstance(content, list) else None
+                if not (isinstance(last, dict) and "cache_control" in last):
+                    continue
+                # A breakpoint an earlier call already sent is a cache read
+                if any(same_prefix(call, earlier, end) for earlier in sent[:i]):
+                    continue
+                written.append((i, end))
+                assert any(
+                    same_prefix(call, later, end) for later in sent[i + 1 :]
+                ), f"call {i} writes an unreadable breakpoint at message {end}"
+        # Round 1's results are written by call 2 and read by the final call
+        assert written == [(1, 2)]
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_max_rounds_enforced(self, MockAnthropic):
         """Even if Claude keeps requesting tools, stops after MAX_TOOL_ROUNDS."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         tool_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
         final_resp = _mock_response(
@@ -269,10 +432,10 @@ class TestAIGeneratorTwoToolRounds:
         client.messages.create.side_effect = [tool_resp, tool_resp, final_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "r"
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -280,12 +443,12 @@ class TestAIGeneratorTwoToolRounds:
 
         assert result == "forced answer"
         assert client.messages.create.call_count == 3  # 2 rounds + 1 final
-        assert tool_manager.execute_tool.call_count == 2
+        assert tool_manager.execute_tool_with_sources.call_count == 2
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_early_stop_no_tool_use_round_2(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_early_stop_no_tool_use_round_2(self, MockAnthropic):
         """Claude uses tool in round 1, answers directly in round 2 → 2 API calls."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
         second_resp = _mock_response(
@@ -294,10 +457,10 @@ class TestAIGeneratorTwoToolRounds:
         client.messages.create.side_effect = [first_resp, second_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "r"
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -307,16 +470,74 @@ class TestAIGeneratorTwoToolRounds:
         assert client.messages.create.call_count == 2
 
 
+# ---------------------------------------------------------------------------
+# Tests — Parallel Tool Calls
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+class TestAIGeneratorParallelTools:
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_tool_calls_in_one_round_run_concurrently(self, MockAnthropic):
+        """Both tools must be in flight at once, or the barrier times out.
+        Sources still follow tool_use order, not completion order."""
+        client = _mock_client(MockAnthropic)
+        first_resp = _mock_response(
+            [
+                _tool_use_block(tool_id="a", input_data={"query": "one"}),
+                _tool_use_block(tool_id="b", input_data={"query": "two"}),
+            ],
+            stop_reason="tool_use",
+        )
+        second_resp = _mock_response([_text_block("done")], stop_reason="end_turn")
+        client.messages.create.side_effect = [first_resp, second_resp]
+
+        barrier = threading.Barrier(2, timeout=5)
+        two_finished = threading.Event()
+
+        def execute_tool(name, query):
+            barrier.wait()
+            # Finish in reverse order of the tool_use blocks
+            if query == "one":
+                two_finished.wait(timeout=5)
+            else:
+                two_finished.set()
+            return f"result for {query}", [{"name": query, "url": None}]
+
+        tool_manager = MagicMock()
+        tool_manager.execute_tool_with_sources.side_effect = execute_tool
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        sources = []
+        result = await gen.generate_response(
+            query="q",
+            tools=[{"name": "t", "description": "", "input_schema": {}}],
+            tool_manager=tool_manager,
+            sources=sources,
+        )
+
+        assert result == "done"
+        assert [s["name"] for s in sources] == ["one", "two"]
+        messages = client.messages.create.call_args_list[1][1]["messages"]
+        tool_results = messages[2]["content"]
+        assert [r["tool_use_id"] for r in tool_results] == ["a", "b"]
+        assert [r["content"] for r in tool_results] == [
+            "result for one",
+            "result for two",
+        ]
+
+
 # ---------------------------------------------------------------------------
 # Tests — Error Handling
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio
 class TestAIGeneratorErrorHandling:
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tool_exception_sends_error_and_terminates(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_tool_exception_sends_error_and_terminates(self, MockAnthropic):
         """Exception → error string as tool_result, loop breaks, final call without tools."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response(
             [_tool_use_block(tool_id="t1")], stop_reason="tool_use"
@@ -325,10 +546,12 @@ class TestAIGeneratorErrorHandling:
         client.messages.create.side_effect = [first_resp, final_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.side_effect = RuntimeError("connection failed")
+        tool_manager.execute_tool_with_sources.side_effect = RuntimeError(
+            "connection failed"
+        )
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -339,16 +562,18 @@ class TestAIGeneratorErrorHandling:
 
         # Verify the error was passed as tool_result
         final_call_kwargs = client.messages.create.call_args_list[1][1]
-        assert "tools" not in final_call_kwargs
+        assert "tools" in final_call_kwargs
         messages = final_call_kwargs["messages"]
+        # The final call follows at once, so nothing could read a breakpoint
+        assert "cache_control" not in messages[2]["content"][0]
         tool_result_content = messages[2]["content"][0]["content"]
         assert "Error executing tool" in tool_result_content
         assert "connection failed" in tool_result_content
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_tool_error_string_flows_through(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_tool_error_string_flows_through(self, MockAnthropic):
         """Tool returns error string (not exception) → flows normally as tool_result."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         first_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
         second_resp = _mock_response(
@@ -357,10 +582,10 @@ class TestAIGeneratorErrorHandling:
         client.messages.create.side_effect = [first_resp, second_resp]
 
         tool_manager = MagicMock()
-        tool_manager.execute_tool.return_value = "Tool 'x' not found"
+        tool_manager.execute_tool_with_sources.return_value = ("Tool 'x' not found", [])
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=tool_manager,
@@ -368,10 +593,10 @@ class TestAIGeneratorErrorHandling:
 
         assert result == "no results found"
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_no_tool_manager_returns_text(self, MockAnthropic):
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_no_tool_manager_returns_text(self, MockAnthropic):
         """tool_manager=None, stop_reason=tool_use → returns available text, no crash."""
-        client = MockAnthropic.return_value
+        client = _mock_client(MockAnthropic)
 
         resp = _mock_response(
             [_text_block("partial"), _tool_use_block()], stop_reason="tool_use"
@@ -379,7 +604,7 @@ class TestAIGeneratorErrorHandling:
         client.messages.create.return_value = resp
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        result = gen.generate_response(
+        result = await gen.generate_response(
             query="q",
             tools=[{"name": "t", "description": "", "input_schema": {}}],
             tool_manager=None,
@@ -387,6 +612,273 @@ class TestAIGeneratorErrorHandling:
 
         assert result == "partial"
 
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_no_text_block_returns_empty_string(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response([], stop_reason="end_turn")
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        result = await gen.generate_response(query="q")
+
+        assert result == ""
+
+
+# ---------------------------------------------------------------------------
+# Tests — Streaming
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+class TestAIGeneratorStreaming:
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_direct_answer_yielded_whole(self, MockAnthropic):
+        """No tool use → the round's text is yielded once, nothing is streamed."""
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("Hello!")], stop_reason="end_turn"
+        )
+        client.messages.stream = MagicMock()
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        chunks = [c async for c in gen.generate_response_stream(query="Hi")]
+
+        assert chunks == ["Hello!"]
+        client.messages.stream.assert_not_called()
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_final_call_streamed_with_same_tools(self, MockAnthropic):
+        """After exhausting tool rounds, the final call streams text deltas."""
+        client = _mock_client(MockAnthropic)
+        tool_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
+        client.messages.create.side_effect = [tool_resp, tool_resp]
+        client.messages.stream = MagicMock(
+            return_value=_FakeStream(["Combined ", "answer."])
+        )
+
+        tool_manager = MagicMock()
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        chunks = [
+            c
+            async for c in gen.generate_response_stream(
+                query="q",
+                tools=[{"name": "t", "description": "", "input_schema": {}}],
+                tool_manager=tool_manager,
+            )
+        ]
+
+        assert chunks == ["Combined ", "answer."]
+        assert client.messages.create.call_count == 2
+        stream_kwargs = client.messages.stream.call_args[1]
+        assert stream_kwargs["tools"] == client.messages.create.call_args[1]["tools"]
+        assert len(stream_kwargs["messages"]) == 5
+
+
+# ---------------------------------------------------------------------------
+# Tests — Response Cache
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+class TestAIGeneratorResponseCache:
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_identical_request_served_from_cache(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("Hello!")], stop_reason="end_turn"
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        first = await gen.generate_response(query="Hi")
+        second = await gen.generate_response(query="Hi")
+
+        assert first == second == "Hello!"
+        client.messages.create.assert_called_once()
+        assert gen.cache_hits == 1
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_different_history_misses_cache(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("ok")], stop_reason="end_turn"
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        await gen.generate_response(query="q")
+        await gen.generate_response(query="q", conversation_history="User: hi")
+
+        assert client.messages.create.call_count == 2
+        assert gen.cache_hits == 0
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_tool_answers_not_cached(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        tool_resp = _mock_response([_tool_use_block()], stop_reason="tool_use")
+        text_resp = _mock_response([_text_block("answer")], stop_reason="end_turn")
+        client.messages.create.side_effect = [tool_resp, text_resp] * 2
+
+        tool_manager = MagicMock()
+        tool_manager.execute_tool_with_sources.return_value = ("r", [])
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        tools = [{"name": "t", "description": "", "input_schema": {}}]
+        for _ in range(2):
+            await gen.generate_response(
+                query="q", tools=tools, tool_manager=tool_manager
+            )
+
+        assert client.messages.create.call_count == 4
+        assert tool_manager.execute_tool_with_sources.call_count == 2
+        assert gen.cache_hits == 0
+
+    @pytest.mark.parametrize(
+        "content, stop_reason",
+        [
+            ([_text_block("The answer is cut")], "max_tokens"),
+            ([_tool_use_block()], "tool_use"),
+        ],
+        ids=["truncated", "tool_use_without_manager"],
+    )
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_incomplete_answers_not_cached(
+        self, MockAnthropic, content, stop_reason
+    ):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            content, stop_reason=stop_reason
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        await gen.generate_response(query="q")
+        await gen.generate_response(query="q")
+
+        assert client.messages.create.call_count == 2
+        assert gen.cache_hits == 0
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_least_recently_used_evicted(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("ok")], stop_reason="end_turn"
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        gen.RESPONSE_CACHE_SIZE = 2
+        await gen.generate_response(query="a")
+        await gen.generate_response(query="b")
+        await gen.generate_response(query="a")  # hit, "b" is now oldest
+        await gen.generate_response(query="c")  # evicts "b"
+        await gen.generate_response(query="b")
+
+        assert gen.cache_hits == 1
+        assert client.messages.create.call_count == 4
+
+
+# ---------------------------------------------------------------------------
+# Tests — In-flight Deduplication
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio
+class TestAIGeneratorInflightDedup:
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_concurrent_identical_requests_share_one_call(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        release = asyncio.Event()
+
+        async def create(**kwargs):
+            await release.wait()
+            return _mock_response([_text_block("Hello!")], stop_reason="end_turn")
+
+        client.messages.create.side_effect = create
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        tasks = [
+            asyncio.create_task(gen.generate_response(query="Hi")) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert results == ["Hello!"] * 3
+        client.messages.create.assert_called_once()
+        assert gen._inflight == {}
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_shared_call_error_reaches_every_caller(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        release = asyncio.Event()
+
+        async def create(**kwargs):
+            await release.wait()
+            raise RuntimeError("overloaded")
+
+        client.messages.create.side_effect = create
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        tasks = [
+            asyncio.create_task(gen.generate_response(query="Hi")) for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        client.messages.create.assert_called_once()
+        assert gen._inflight == {}
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_tool_using_requests_share_only_round_one(self, MockAnthropic):
+        """A shared tool_use first reply still leads to exactly one search per
+        caller, each into its own sources; later rounds are not shared."""
+        client = _mock_client(MockAnthropic)
+        release = asyncio.Event()
+
+        async def create(**kwargs):
+            await release.wait()
+            if len(kwargs["messages"]) == 1:
+                return _mock_response([_tool_use_block()], stop_reason="tool_use")
+            return _mock_response([_text_block("answer")], stop_reason="end_turn")
+
+        client.messages.create.side_effect = create
+
+        def manager(name):
+            tool_manager = MagicMock()
+            tool_manager.execute_tool_with_sources.return_value = (
+                "r",
+                [{"name": name, "url": None}],
+            )
+            return tool_manager
+
+        managers = [manager("first"), manager("second")]
+        source_lists = [[], []]
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        tools = [{"name": "t", "description": "", "input_schema": {}}]
+        tasks = [
+            asyncio.create_task(
+                gen.generate_response(
+                    query="q", tools=tools, tool_manager=tm, sources=sources
+                )
+            )
+            for tm, sources in zip(managers, source_lists)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        assert results == ["answer", "answer"]
+        # One shared first round, then one second-round call per caller
+        assert client.messages.create.call_count == 3
+        for tm in managers:
+            tm.execute_tool_with_sources.assert_called_once()
+        assert source_lists == [
+            [{"name": "first", "url": None}],
+            [{"name": "second", "url": None}],
+        ]
+        assert gen._inflight == {}
+
 
 # ---------------------------------------------------------------------------
 # Tests — Params and Constants
@@ -394,50 +886,128 @@ class TestAIGeneratorErrorHandling:
 
 
 class TestAIGeneratorParams:
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_conversation_history_in_system_prompt(self, MockAnthropic):
-        client = MockAnthropic.return_value
+    @pytest.mark.asyncio
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_conversation_history_in_system_prompt(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
         client.messages.create.return_value = _mock_response(
             [_text_block("ok")], stop_reason="end_turn"
         )
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(
+        await gen.generate_response(
             query="q", conversation_history="User: hi\nAssistant: hello"
         )
 
-        call_kwargs = client.messages.create.call_args[1]
-        assert "Previous conversation:" in call_kwargs["system"]
-        assert "User: hi" in call_kwargs["system"]
-
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_no_history_system_prompt(self, MockAnthropic):
-        client = MockAnthropic.return_value
+        system = client.messages.create.call_args[1]["system"]
+        assert len(system) == 2
+        assert system[0]["text"] == AIGenerator.SYSTEM_PROMPT
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
+        assert "Previous conversation:" in system[1]["text"]
+        assert "User: hi" in system[1]["text"]
+        assert "cache_control" not in system[1]
+
+    @pytest.mark.asyncio
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_no_history_system_prompt(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
         client.messages.create.return_value = _mock_response(
             [_text_block("ok")], stop_reason="end_turn"
         )
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(query="q")
+        await gen.generate_response(query="q")
 
-        call_kwargs = client.messages.create.call_args[1]
-        assert "Previous conversation:" not in call_kwargs["system"]
+        system = client.messages.create.call_args[1]["system"]
+        assert len(system) == 1
+        assert system[0]["text"] == AIGenerator.SYSTEM_PROMPT
+        assert system[0]["cache_control"] == {"type": "ephemeral"}
 
-    @patch("ai_generator.anthropic.Anthropic")
-    def test_base_params_applied(self, MockAnthropic):
-        client = MockAnthropic.return_value
+    @pytest.mark.asyncio
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_base_params_applied(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
         client.messages.create.return_value = _mock_response(
             [_text_block("ok")], stop_reason="end_turn"
         )
 
         gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
-        gen.generate_response(query="q")
+        await gen.generate_response(query="q")
 
         call_kwargs = client.messages.create.call_args[1]
         assert call_kwargs["model"] == "claude-sonnet-4-20250514"
         assert call_kwargs["temperature"] == 0
         assert call_kwargs["max_tokens"] == 800
 
+    @pytest.mark.asyncio
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_no_history_system_content_reused(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("ok")], stop_reason="end_turn"
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        await gen.generate_response(query="a")
+        await gen.generate_response(query="b", conversation_history="User: hi")
+        await gen.generate_response(query="c")
+
+        first, with_history, third = (
+            c[1]["system"] for c in client.messages.create.call_args_list
+        )
+        assert first is third
+        assert len(first) == 1
+        assert with_history[0] is first[0]
+
+    @pytest.mark.asyncio
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    async def test_long_history_trimmed_to_recent_lines(self, MockAnthropic):
+        client = _mock_client(MockAnthropic)
+        client.messages.create.return_value = _mock_response(
+            [_text_block("ok")], stop_reason="end_turn"
+        )
+
+        gen = AIGenerator(api_key="fake", model="claude-sonnet-4-20250514")
+        gen.max_history_tokens = 10  # ~40 chars
+        history = "User: " + "x" * 100 + "\nAssistant: recent reply"
+        await gen.generate_response(query="q", conversation_history=history)
+
+        system = client.messages.create.call_args[1]["system"]
+        assert system[1]["text"] == "Previous conversation:\nAssistant: recent reply"
+
+    @pytest.mark.parametrize(
+        "text, expected",
+        [
+            # "User: q\nAssistant: r" is exactly 20 chars, so it all fits
+            ("xxx\nUser: q\nAssistant: r", "User: q\nAssistant: r"),
+            ("xxxxUser: q\nAssistant: r", "Assistant: r"),
+            ("User: q\nAssistant: r", "User: q\nAssistant: r"),
+        ],
+        ids=["cut_on_line_start", "cut_mid_line", "fits"],
+    )
+    def test_tail_tokens_keeps_whole_lines(self, text, expected):
+        assert _tail_tokens(text, 5) == expected
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    def test_client_shared_per_api_key(self, MockAnthropic):
+        MockAnthropic.side_effect = lambda **kwargs: MagicMock()
+
+        first = AIGenerator(api_key="key-a", model="m")
+        second = AIGenerator(api_key="key-a", model="m")
+        other = AIGenerator(api_key="key-b", model="m")
+
+        assert first.client is second.client
+        assert other.client is not first.client
+        assert MockAnthropic.call_count == 2
+
+    @patch("ai_generator.anthropic.AsyncAnthropic")
+    def test_client_retry_and_timeout_settings(self, MockAnthropic):
+        AIGenerator(api_key="fake", model="m")
+
+        MockAnthropic.assert_called_once_with(
+            api_key="fake", max_retries=4, timeout=30.0
+        )
+
     def test_system_prompt_allows_two_searches(self):
         assert "2 searches" in AIGenerator.SYSTEM_PROMPT
 
@@ -1,15 +1,23 @@
+import json
+
+import pytest
+
+# The test app and its RAGSystem mock are shared across the session
+pytestmark = pytest.mark.usefixtures("reset_mock_rag_system")
+
 # ---------------------------------------------------------------------------
 # Tests — POST /api/query
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio(loop_scope="session")
 class TestQueryEndpoint:
-    def test_query_success(self, client, test_app):
+    async def test_query_success(self, client, test_app):
         """200 response with correct JSON shape."""
         _, mock_rag = test_app
         mock_rag.query.return_value = ("The answer is 42", [{"source": "guide.txt"}])
 
-        resp = client.post("/api/query", json={"query": "What is the answer?", "session_id": "s1"})
+        resp = await client.post("/api/query", json={"query": "What is the answer?", "session_id": "s1"})
 
         assert resp.status_code == 200
         data = resp.json()
@@ -17,28 +25,28 @@ class TestQueryEndpoint:
         assert data["session_id"] == "s1"
         assert isinstance(data["sources"], list)
 
-    def test_query_creates_session_when_missing(self, client, test_app):
+    async def test_query_creates_session_when_missing(self, client, test_app):
         """When no session_id is provided, one is auto-created."""
         _, mock_rag = test_app
         mock_rag.session_manager.create_session.return_value = "auto-abc"
 
-        resp = client.post("/api/query", json={"query": "hello"})
+        resp = await client.post("/api/query", json={"query": "hello"})
 
         assert resp.status_code == 200
         assert resp.json()["session_id"] == "auto-abc"
         mock_rag.session_manager.create_session.assert_called_once()
 
-    def test_query_uses_provided_session_id(self, client, test_app):
+    async def test_query_uses_provided_session_id(self, client, test_app):
         """Passes through an existing session_id without creating a new one."""
         _, mock_rag = test_app
 
-        resp = client.post("/api/query", json={"query": "hi", "session_id": "existing-1"})
+        resp = await client.post("/api/query", json={"query": "hi", "session_id": "existing-1"})
 
         assert resp.status_code == 200
         assert resp.json()["session_id"] == "existing-1"
         mock_rag.session_manager.create_session.assert_not_called()
 
-    def test_query_returns_sources(self, client, test_app):
+    async def test_query_returns_sources(self, client, test_app):
         """Sources array is included in response."""
         _, mock_rag = test_app
         mock_rag.query.return_value = (
@@ -46,37 +54,99 @@ class TestQueryEndpoint:
             [{"source": "a.txt", "page": 1}, {"source": "b.txt", "page": 2}],
         )
 
-        resp = client.post("/api/query", json={"query": "q", "session_id": "s"})
+        resp = await client.post("/api/query", json={"query": "q", "session_id": "s"})
 
         sources = resp.json()["sources"]
         assert len(sources) == 2
         assert sources[0]["source"] == "a.txt"
         assert sources[1]["source"] == "b.txt"
 
-    def test_query_internal_error(self, client, test_app):
+    async def test_query_internal_error(self, client, test_app):
         """When rag.query raises, the endpoint returns 500."""
         _, mock_rag = test_app
         mock_rag.query.side_effect = RuntimeError("db connection lost")
 
-        resp = client.post("/api/query", json={"query": "q", "session_id": "s"})
+        resp = await client.post("/api/query", json={"query": "q", "session_id": "s"})
 
         assert resp.status_code == 500
-        assert "db connection lost" in resp.json()["detail"]
+        assert b"db connection lost" in resp.content
 
-    def test_query_missing_body(self, client):
+    async def test_query_missing_body(self, client):
         """No request body → 422 validation error."""
-        resp = client.post("/api/query")
+        resp = await client.post("/api/query")
 
         assert resp.status_code == 422
 
 
+# ---------------------------------------------------------------------------
+# Tests — POST /api/query/stream
+# ---------------------------------------------------------------------------
+
+
+@pytest.mark.asyncio(loop_scope="session")
+class TestQueryStreamEndpoint:
+    async def test_stream_success(self, client, test_app, stream_events):
+        """Text events arrive first, then a done event with sources."""
+        _, mock_rag = test_app
+        mock_rag.query_stream.side_effect = stream_events(
+            {"type": "text", "text": "The answer "},
+            {"type": "text", "text": "is 42"},
+            {"type": "done", "sources": [{"source": "guide.txt"}]},
+        )
+
+        resp = await client.post("/api/query/stream", json={"query": "q", "session_id": "s1"})
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/x-ndjson"
+        events = [json.loads(line) for line in resp.text.splitlines()]
+        assert "".join(e["text"] for e in events if e["type"] == "text") == (
+            "The answer is 42"
+        )
+        assert events[-1] == {
+            "type": "done",
+            "sources": [{"source": "guide.txt"}],
+            "session_id": "s1",
+        }
+
+    async def test_stream_creates_session_when_missing(self, client, test_app):
+        """When no session_id is provided, one is auto-created."""
+        _, mock_rag = test_app
+        mock_rag.session_manager.create_session.return_value = "auto-abc"
+
+        resp = await client.post("/api/query/stream", json={"query": "hello"})
+
+        done = json.loads(resp.text.splitlines()[-1])
+        assert done["session_id"] == "auto-abc"
+        mock_rag.query_stream.assert_called_once_with("hello", "auto-abc")
+
+    async def test_stream_error_after_partial_text(self, client, test_app):
+        """A failure mid-stream ends the body with an error event, not a cut-off."""
+        _, mock_rag = test_app
+
+        async def failing_stream(*args, **kwargs):
+            yield {"type": "text", "text": "partial"}
+            raise RuntimeError("model overloaded")
+
+        mock_rag.query_stream.side_effect = failing_stream
+
+        resp = await client.post("/api/query/stream", json={"query": "q", "session_id": "s"})
+
+        assert resp.status_code == 200
+        events = [json.loads(line) for line in resp.text.splitlines()]
+        assert events == [
+            {"type": "text", "text": "partial"},
+            {"type": "error", "detail": "model overloaded"},
+        ]
+
+
 # ---------------------------------------------------------------------------
 # Tests — GET /api/courses
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio(loop_scope="session")
 class TestCoursesEndpoint:
-    def test_courses_success(self, client, test_app):
+    async def test_courses_success(self, client, test_app):
         """200 response with correct shape."""
         _, mock_rag = test_app
         mock_rag.get_course_analytics.return_value = {
@@ -84,7 +154,7 @@ class TestCoursesEndpoint:
             "course_titles": ["ML 101", "NLP 201", "DL 301"],
         }
 
-        resp = client.get("/api/courses")
+        resp = await client.get("/api/courses")
 
         assert resp.status_code == 200
         data = resp.json()
@@ -92,7 +162,7 @@ class TestCoursesEndpoint:
         assert len(data["course_titles"]) == 3
         assert "ML 101" in data["course_titles"]
 
-    def test_courses_empty(self, client, test_app):
+    async def test_courses_empty(self, client, test_app):
         """Zero courses returns empty list."""
         _, mock_rag = test_app
         mock_rag.get_course_analytics.return_value = {
@@ -100,22 +170,22 @@ class TestCoursesEndpoint:
             "course_titles": [],
         }
 
-        resp = client.get("/api/courses")
+        resp = await client.get("/api/courses")
 
         assert resp.status_code == 200
         data = resp.json()
         assert data["total_courses"] == 0
         assert data["course_titles"] == []
 
-    def test_courses_internal_error(self, client, test_app):
+    async def test_courses_internal_error(self, client, test_app):
         """When analytics raises, the endpoint returns 500."""
         _, mock_rag = test_app
         mock_rag.get_course_analytics.side_effect = RuntimeError("storage unavailable")
 
-        resp = client.get("/api/courses")
+        resp = await client.get("/api/courses")
 
         assert resp.status_code == 500
-        assert "storage unavailable" in resp.json()["detail"]
+        assert b"storage unavailable" in resp.content
 
 
 # ---------------------------------------------------------------------------
@@ -123,18 +193,19 @@ class TestCoursesEndpoint:
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio(loop_scope="session")
 class TestDeleteSessionEndpoint:
-    def test_delete_session_success(self, client):
+    async def test_delete_session_success(self, client):
         """200 response with {"status": "ok"}."""
-        resp = client.delete("/api/sessions/sess-42")
+        resp = await client.delete("/api/sessions/sess-42")
 
         assert resp.status_code == 200
         assert resp.json() == {"status": "ok"}
 
-    def test_delete_session_calls_manager(self, client, test_app):
+    async def test_delete_session_calls_manager(self, client, test_app):
         """Verifies delete_session is called with the correct session_id."""
         _, mock_rag = test_app
 
-        client.delete("/api/sessions/sess-99")
+        await client.delete("/api/sessions/sess-99")
 
         mock_rag.session_manager.delete_session.assert_called_once_with("sess-99")
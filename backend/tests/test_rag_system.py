@@ -1,7 +1,55 @@
-from unittest.mock import patch, MagicMock, call
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock, DEFAULT, call
 import pytest
 from vector_store import SearchResults
 from config import Config
+from ai_generator import AIGenerator
+from rag_system import RAGSystem
+from session_manager import SessionManager
+
+# What VectorStore.search returns when ChromaDB rejects n_results=0
+_MAX_RESULTS_ZERO_ERROR = SearchResults.empty(
+    "Search error: Number of requested results 0, cannot be less than 1."
+)
+
+
+@pytest.fixture(scope="module")
+def patched_rag_deps():
+    """Patch RAGSystem's four heavy dependencies once for the whole module."""
+    with patch.multiple(
+        "rag_system",
+        SessionManager=DEFAULT,
+        DocumentProcessor=DEFAULT,
+        AIGenerator=DEFAULT,
+        VectorStore=DEFAULT,
+    ) as mocks:
+        yield mocks
+
+
+@pytest.fixture
+def rag_deps(patched_rag_deps):
+    """The patched dependency classes, reset so each test gets fresh instances."""
+    for mock in patched_rag_deps.values():
+        mock.reset_mock(return_value=True, side_effect=True)
+    return patched_rag_deps
+
+
+def _cfg(**overrides):
+    """A plain Config stand-in with test values; keyword args override fields."""
+    fields = dict(
+        MAX_RESULTS=5,
+        CHROMA_PATH="/tmp/chroma",
+        EMBEDDING_MODEL="all-MiniLM-L6-v2",
+        ANTHROPIC_API_KEY="fake",
+        ANTHROPIC_MODEL="claude-sonnet-4-20250514",
+        CHUNK_SIZE=800,
+        CHUNK_OVERLAP=100,
+        MAX_HISTORY=2,
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
 
 # ---------------------------------------------------------------------------
 # Config propagation
@@ -16,49 +64,18 @@ class TestRAGSystemInit:
             cfg.MAX_RESULTS >= 1
         ), f"MAX_RESULTS={cfg.MAX_RESULTS} would cause ChromaDB query errors"
 
-    @patch("rag_system.SessionManager")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.VectorStore")
-    def test_max_results_passed_to_vector_store(self, MockVS, MockAI, MockDP, MockSM):
-        from rag_system import RAGSystem
-
-        config = MagicMock()
-        config.MAX_RESULTS = 5
-        config.CHROMA_PATH = "/tmp/chroma"
-        config.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
-        config.ANTHROPIC_API_KEY = "fake"
-        config.ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
-        config.CHUNK_SIZE = 800
-        config.CHUNK_OVERLAP = 100
-        config.MAX_HISTORY = 2
-
-        RAGSystem(config)
-
-        MockVS.assert_called_once_with("/tmp/chroma", "all-MiniLM-L6-v2", 5)
-
-    # ---- Bug reproduction ----
-    @patch("rag_system.SessionManager")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.VectorStore")
-    def test_init_max_results_zero_propagates(self, MockVS, MockAI, MockDP, MockSM):
-        """Proves that MAX_RESULTS=0 from config is passed directly to VectorStore."""
-        from rag_system import RAGSystem
-
-        config = MagicMock()
-        config.MAX_RESULTS = 0
-        config.CHROMA_PATH = "/tmp/chroma"
-        config.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
-        config.ANTHROPIC_API_KEY = "fake"
-        config.ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
-        config.CHUNK_SIZE = 800
-        config.CHUNK_OVERLAP = 100
-        config.MAX_HISTORY = 2
-
-        RAGSystem(config)
-
-        MockVS.assert_called_once_with("/tmp/chroma", "all-MiniLM-L6-v2", 0)
+    # MAX_RESULTS=0 is the bug reproduction: config is passed straight through
+    @pytest.mark.parametrize("max_results", [5, 0])
+    def test_max_results_forwarded_to_vector_store(self, rag_deps, max_results):
+        RAGSystem(_cfg(MAX_RESULTS=max_results))
+
+        MockVS = rag_deps["VectorStore"]
+        assert MockVS.call_count == 1
+        assert MockVS.call_args.args == (
+            "/tmp/chroma",
+            "all-MiniLM-L6-v2",
+            max_results,
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -66,37 +83,29 @@ class TestRAGSystemInit:
 # ---------------------------------------------------------------------------
 
 
+@pytest.mark.asyncio
 class TestRAGSystemQuery:
-    def _make_rag(self, max_results=5):
-        """Build a RAGSystem with all heavy deps mocked out."""
-        with (
-            patch("rag_system.VectorStore") as MockVS,
-            patch("rag_system.AIGenerator") as MockAI,
-            patch("rag_system.DocumentProcessor"),
-            patch("rag_system.SessionManager") as MockSM,
-        ):
-
-            config = MagicMock()
-            config.MAX_RESULTS = max_results
-            config.CHROMA_PATH = "/tmp"
-            config.EMBEDDING_MODEL = "m"
-            config.ANTHROPIC_API_KEY = "k"
-            config.ANTHROPIC_MODEL = "model"
-            config.CHUNK_SIZE = 800
-            config.CHUNK_OVERLAP = 100
-            config.MAX_HISTORY = 2
-
-            from rag_system import RAGSystem
-
-            rag = RAGSystem(config)
-            return rag, MockAI, MockSM
-
-    def test_query_calls_ai_with_tools(self):
-        rag, MockAI, MockSM = self._make_rag()
-        rag.session_manager.get_conversation_history.return_value = None
+    def _make_rag(self, rag_deps, max_results=5):
+        """Build a RAGSystem on top of the module's patched deps."""
+        config = _cfg(MAX_RESULTS=max_results)
+
+        MockAI, MockSM = rag_deps["AIGenerator"], rag_deps["SessionManager"]
+        MockAI.return_value.generate_response = AsyncMock()
+        MockSM.return_value = MagicMock(spec_set=SessionManager)
+        rag = RAGSystem(config)
+        rag.session_manager.configure_mock(
+            **{
+                "get_conversation_history.return_value": None,
+                "add_exchange.return_value": None,
+            }
+        )
+        return rag, MockAI, MockSM
+
+    async def test_query_calls_ai_with_tools(self, rag_deps):
+        rag, MockAI, MockSM = self._make_rag(rag_deps)
         rag.ai_generator.generate_response.return_value = "AI answer"
 
-        response, sources = rag.query("What is ML?")
+        response, sources = await rag.query("What is ML?")
 
         assert response == "AI answer"
         rag.ai_generator.generate_response.assert_called_once()
@@ -104,25 +113,24 @@ class TestRAGSystemQuery:
         assert "tools" in call_kwargs
         assert call_kwargs["tool_manager"] is rag.tool_manager
 
-    def test_query_retrieves_history_for_session(self):
-        rag, _, _ = self._make_rag()
+    async def test_query_retrieves_history_for_session(self, rag_deps):
+        rag, _, _ = self._make_rag(rag_deps)
         rag.session_manager.get_conversation_history.return_value = (
             "User: hi\nAssistant: hello"
         )
         rag.ai_generator.generate_response.return_value = "answer"
 
-        rag.query("follow up", session_id="s1")
+        await rag.query("follow up", session_id="s1")
 
         rag.session_manager.get_conversation_history.assert_called_with("s1")
         call_kwargs = rag.ai_generator.generate_response.call_args[1]
         assert call_kwargs["conversation_history"] == "User: hi\nAssistant: hello"
 
-    def test_query_records_exchange(self):
-        rag, _, _ = self._make_rag()
-        rag.session_manager.get_conversation_history.return_value = None
+    async def test_query_records_exchange(self, rag_deps):
+        rag, _, _ = self._make_rag(rag_deps)
         rag.ai_generator.generate_response.return_value = "answer"
 
-        rag.query("question", session_id="s1")
+        await rag.query("question", session_id="s1")
 
         rag.session_manager.add_exchange.assert_called_once()
         args = rag.session_manager.add_exchange.call_args[0]
@@ -130,20 +138,102 @@ class TestRAGSystemQuery:
         assert "question" in args[1]
         assert args[2] == "answer"
 
-    def test_query_resets_sources_after_retrieval(self):
-        rag, _, _ = self._make_rag()
-        rag.session_manager.get_conversation_history.return_value = None
-        rag.ai_generator.generate_response.return_value = "answer"
+    async def test_query_returns_sources_collected_during_generation(self, rag_deps):
+        rag, _, _ = self._make_rag(rag_deps)
+
+        async def fake_generate(**kwargs):
+            kwargs["sources"].append({"name": "X", "url": None})
+            return "answer"
 
-        # Pre-populate sources on the search tool
-        rag.search_tool.last_sources = [{"name": "X", "url": None}]
+        rag.ai_generator.generate_response.side_effect = fake_generate
 
-        response, sources = rag.query("q")
+        response, sources = await rag.query("q")
 
-        # Sources should have been retrieved then reset
+        # Sources come from this query's collector, not the shared search tool
         assert sources == [{"name": "X", "url": None}]
         assert rag.search_tool.last_sources == []
 
+    async def test_query_stream_events_and_exchange(self, rag_deps):
+        rag, _, _ = self._make_rag(rag_deps)
+
+        async def fake_stream(**kwargs):
+            kwargs["sources"].append({"name": "X", "url": None})
+            yield "ans"
+            yield "wer"
+
+        rag.ai_generator.generate_response_stream = MagicMock(side_effect=fake_stream)
+
+        events = [e async for e in rag.query_stream("question", session_id="s1")]
+
+        assert events == [
+            {"type": "text", "text": "ans"},
+            {"type": "text", "text": "wer"},
+            {"type": "done", "sources": [{"name": "X", "url": None}]},
+        ]
+        rag.session_manager.add_exchange.assert_called_once_with(
+            "s1", "question", "answer"
+        )
+
+
+@pytest.mark.asyncio
+class TestRAGSystemConcurrency:
+    async def test_interleaved_queries_keep_their_own_sources(self, rag_deps):
+        """A query that searches and one that does not, run interleaved
+        against a real AIGenerator, each get only their own sources."""
+        rag = RAGSystem(_cfg())
+        rag.vector_store.search.return_value = SearchResults(
+            documents=["content"],
+            metadata=[{"course_title": "Course A", "lesson_number": 1}],
+            distances=[0.1],
+        )
+        rag.vector_store.get_lesson_link.return_value = None
+
+        a_searched = asyncio.Event()
+        b_finished = asyncio.Event()
+
+        def reply(text):
+            return SimpleNamespace(
+                stop_reason="end_turn",
+                content=[SimpleNamespace(type="text", text=text)],
+            )
+
+        async def create(**params):
+            messages = params["messages"]
+            if "course A" not in messages[0]["content"]:
+                # B answers directly, but only once A's search has run
+                await a_searched.wait()
+                return reply("answer B")
+            if len(messages) == 1:
+                search = SimpleNamespace(
+                    type="tool_use",
+                    id="t1",
+                    name="search_course_content",
+                    input={"query": "course A"},
+                )
+                return SimpleNamespace(stop_reason="tool_use", content=[search])
+            # A only finishes after B has returned its sources
+            a_searched.set()
+            await b_finished.wait()
+            return reply("answer A")
+
+        rag.ai_generator = AIGenerator("fake", "claude-sonnet-4-20250514")
+        rag.ai_generator.client = SimpleNamespace(
+            messages=SimpleNamespace(create=create)
+        )
+
+        async def query_b():
+            result = await rag.query("Say hello")
+            b_finished.set()
+            return result
+
+        (answer_a, sources_a), (answer_b, sources_b) = await asyncio.wait_for(
+            asyncio.gather(rag.query("Tell me about course A"), query_b()), timeout=5
+        )
+
+        assert (answer_a, answer_b) == ("answer A", "answer B")
+        assert sources_a == [{"name": "Course A - Lesson 1", "url": None}]
+        assert sources_b == []
+
 
 # ---------------------------------------------------------------------------
 # End-to-end bug reproduction
@@ -151,59 +241,34 @@ class TestRAGSystemQuery:
 
 
 class TestRAGSystemBugE2E:
-    @patch("rag_system.SessionManager")
-    @patch("rag_system.DocumentProcessor")
-    @patch("rag_system.AIGenerator")
-    @patch("rag_system.VectorStore")
-    def test_max_results_zero_produces_search_error(
-        self, MockVS, MockAI, MockDP, MockSM
-    ):
-        """End-to-end: MAX_RESULTS=0 → VectorStore.search returns error →
-        CourseSearchTool returns error string → AI receives error as tool result →
-        response contains unhelpful answer."""
-        from rag_system import RAGSystem
-
-        config = MagicMock()
-        config.MAX_RESULTS = 0
-        config.CHROMA_PATH = "/tmp"
-        config.EMBEDDING_MODEL = "m"
-        config.ANTHROPIC_API_KEY = "k"
-        config.ANTHROPIC_MODEL = "model"
-        config.CHUNK_SIZE = 800
-        config.CHUNK_OVERLAP = 100
-        config.MAX_HISTORY = 2
+    @pytest.mark.asyncio
+    async def test_max_results_zero_produces_search_error(self, rag_deps):
+        """MAX_RESULTS=0: RAGSystem hands its tool_manager to the AI, and the
+        search tool behind it returns ChromaDB's search error as its result."""
+        config = _cfg(MAX_RESULTS=0)
 
         # VectorStore.search returns the error that ChromaDB would produce
-        mock_vs_instance = MockVS.return_value
-        mock_vs_instance.search.return_value = SearchResults.empty(
-            "Search error: Number of requested results 0, cannot be less than 1."
-        )
-
-        # AI generator: simulate tool use flow
-        # First call: Claude decides to use the search tool
-        # We mock generate_response to actually call tool_manager.execute_tool
-        # so we can verify the error propagates
-        def fake_generate(
-            query, conversation_history=None, tools=None, tool_manager=None
-        ):
-            if tool_manager:
-                result = tool_manager.execute_tool(
-                    "search_course_content", query="test query"
-                )
-                # The AI would see this error and produce an unhelpful response
-                if "Search error" in result:
-                    return "I'm sorry, I encountered an error while searching."
-            return "normal response"
+        mock_vs_instance = rag_deps["VectorStore"].return_value
+        mock_vs_instance.search.return_value = _MAX_RESULTS_ZERO_ERROR
 
-        mock_ai = MockAI.return_value
-        mock_ai.generate_response.side_effect = fake_generate
+        # The AI is stubbed out; the tool path is exercised directly below
+        mock_ai = rag_deps["AIGenerator"].return_value
+        mock_ai.generate_response = AsyncMock(
+            return_value="I'm sorry, I encountered an error while searching."
+        )
 
-        mock_sm = MockSM.return_value
+        mock_sm = rag_deps["SessionManager"].return_value
         mock_sm.get_conversation_history.return_value = None
 
         rag = RAGSystem(config)
-        response, sources = rag.query("What is machine learning?")
+        await rag.query("What is machine learning?")
 
-        assert "error" in response.lower()
-        # Verify the search was called with n_results=0 path
+        call_kwargs = mock_ai.generate_response.call_args[1]
+        assert call_kwargs["tool_manager"] is rag.tool_manager
+
+        # The tool handed to the AI surfaces ChromaDB's error as its result
+        result = rag.tool_manager.execute_tool(
+            "search_course_content", query="test query"
+        )
+        assert "Search error" in result
         mock_vs_instance.search.assert_called_once()
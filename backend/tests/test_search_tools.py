@@ -3,20 +3,54 @@ import pytest
 from vector_store import SearchResults
 from search_tools import CourseSearchTool, ToolManager
 
+# Shared, read-only search results reused across tests
+_DOCKER_WITH_LESSON = SearchResults(
+    documents=["content"],
+    metadata=[{"course_title": "Docker Basics", "lesson_number": 4}],
+    distances=[0.2],
+)
+_DOCKER_NO_LESSON = SearchResults(
+    documents=["content"],
+    metadata=[{"course_title": "Docker Basics"}],
+    distances=[0.2],
+)
+_EMPTY_ERROR = SearchResults.empty("Search error: something broke")
+_MAX_RESULTS_ZERO_ERROR = SearchResults.empty(
+    "Search error: Number of requested results 0, cannot be less than 1."
+)
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
 
+class _StubStore:
+    """Minimal VectorStore stand-in exposing only what CourseSearchTool uses.
+    search stays a MagicMock so tests can assert on its call args."""
+
+    def __init__(self, search_return, lesson_link=None):
+        self.search = MagicMock(return_value=search_return)
+        self._lesson_link = lesson_link
+
+    def get_lesson_link(self, course_title, lesson_number):
+        return self._lesson_link
+
+
 def _make_store(**overrides):
-    """Return a MagicMock VectorStore with sensible defaults."""
-    store = MagicMock()
-    store.search.return_value = overrides.get(
-        "search_return",
-        SearchResults(documents=[], metadata=[], distances=[]),
+    """Return a stub VectorStore with sensible defaults."""
+    return _StubStore(
+        overrides.get(
+            "search_return",
+            SearchResults(documents=[], metadata=[], distances=[]),
+        ),
+        lesson_link=overrides.get("lesson_link"),
     )
-    store.get_lesson_link.return_value = overrides.get("lesson_link", None)
-    return store
+
+
+@pytest.fixture(scope="class")
+def empty_tool():
+    """A CourseSearchTool whose store always returns no results."""
+    return CourseSearchTool(_make_store())
 
 
 # ---------------------------------------------------------------------------
@@ -58,31 +92,28 @@ class TestCourseSearchToolExecute:
         assert tool.last_sources[0]["name"] == "ML - Lesson 2"
         assert tool.last_sources[0]["url"] == "https://example.com/ml/2"
 
-    def test_empty_results_no_filter(self):
-        tool = CourseSearchTool(_make_store())
-        result = tool.execute(query="unknown topic")
-        assert result == "No relevant content found."
-
-    def test_empty_results_with_course_filter(self):
-        tool = CourseSearchTool(_make_store())
-        result = tool.execute(query="topic", course_name="Physics 101")
-        assert "Physics 101" in result
-
-    def test_empty_results_with_lesson_filter(self):
-        tool = CourseSearchTool(_make_store())
-        result = tool.execute(query="topic", lesson_number=3)
-        assert "lesson 3" in result
-
-    def test_empty_results_with_both_filters(self):
-        tool = CourseSearchTool(_make_store())
-        result = tool.execute(query="topic", course_name="Physics", lesson_number=5)
-        assert "Physics" in result
-        assert "lesson 5" in result
+    @pytest.mark.parametrize(
+        "filters,expected",
+        [
+            ({}, "No relevant content found."),
+            (
+                {"course_name": "Physics 101"},
+                "No relevant content found in course 'Physics 101'.",
+            ),
+            ({"lesson_number": 3}, "No relevant content found in lesson 3."),
+            (
+                {"course_name": "Physics", "lesson_number": 5},
+                "No relevant content found in course 'Physics' in lesson 5.",
+            ),
+        ],
+        ids=["no_filter", "course_filter", "lesson_filter", "both_filters"],
+    )
+    def test_empty_results(self, empty_tool, filters, expected):
+        result = empty_tool.execute(query="topic", **filters)
+        assert result == expected
 
     def test_error_propagated(self):
-        store = _make_store(
-            search_return=SearchResults.empty("Search error: something broke")
-        )
+        store = _make_store(search_return=_EMPTY_ERROR)
         tool = CourseSearchTool(store)
         result = tool.execute(query="anything")
         assert result == "Search error: something broke"
@@ -91,11 +122,7 @@ class TestCourseSearchToolExecute:
     def test_execute_max_results_zero_causes_search_error(self):
         """Proves that when VectorStore is configured with max_results=0,
         ChromaDB raises an error which propagates as a string result."""
-        store = _make_store(
-            search_return=SearchResults.empty(
-                "Search error: Number of requested results 0, cannot be less than 1."
-            )
-        )
+        store = _make_store(search_return=_MAX_RESULTS_ZERO_ERROR)
         tool = CourseSearchTool(store)
         result = tool.execute(query="what is machine learning")
         assert "Search error" in result
@@ -111,46 +138,26 @@ class TestFormatResults:
     def test_header_without_lesson(self):
         store = _make_store()
         tool = CourseSearchTool(store)
-        results = SearchResults(
-            documents=["content"],
-            metadata=[{"course_title": "Docker Basics"}],
-            distances=[0.2],
-        )
-        formatted = tool._format_results(results)
+        formatted = tool._format_results(_DOCKER_NO_LESSON)
         assert "[Docker Basics]" in formatted
         assert "Lesson" not in formatted
 
     def test_header_with_lesson(self):
         store = _make_store()
         tool = CourseSearchTool(store)
-        results = SearchResults(
-            documents=["content"],
-            metadata=[{"course_title": "Docker Basics", "lesson_number": 4}],
-            distances=[0.2],
-        )
-        formatted = tool._format_results(results)
+        formatted = tool._format_results(_DOCKER_WITH_LESSON)
         assert "[Docker Basics - Lesson 4]" in formatted
 
     def test_source_url_with_lesson_link(self):
         store = _make_store(lesson_link="https://example.com/lesson/4")
         tool = CourseSearchTool(store)
-        results = SearchResults(
-            documents=["content"],
-            metadata=[{"course_title": "Docker Basics", "lesson_number": 4}],
-            distances=[0.2],
-        )
-        tool._format_results(results)
+        tool._format_results(_DOCKER_WITH_LESSON)
         assert tool.last_sources[0]["url"] == "https://example.com/lesson/4"
 
     def test_source_url_none_without_lesson(self):
         store = _make_store()
         tool = CourseSearchTool(store)
-        results = SearchResults(
-            documents=["content"],
-            metadata=[{"course_title": "Docker Basics"}],
-            distances=[0.2],
-        )
-        tool._format_results(results)
+        tool._format_results(_DOCKER_NO_LESSON)
         assert tool.last_sources[0]["url"] is None
 
 
@@ -188,11 +195,16 @@ class TestToolManager:
         result = tm.execute_tool("nonexistent", query="test")
         assert "not found" in result
 
-    def test_get_and_reset_sources(self):
+    def test_execute_with_sources_returns_them_per_call(self):
         tm = self._registered_manager()
-        tm.execute_tool("search_course_content", query="test")
-        sources = tm.get_last_sources()
+        result, sources = tm.execute_tool_with_sources(
+            "search_course_content", query="test"
+        )
+        assert "data" in result
         assert len(sources) == 1
+        # Nothing is left on the shared tool for another query to pick up
+        assert tm.tools["search_course_content"].last_sources == []
 
-        tm.reset_sources()
-        assert tm.get_last_sources() == []
+        result, sources = tm.execute_tool_with_sources("nonexistent", query="test")
+        assert "not found" in result
+        assert sources == []